@@ -1,8 +1,8 @@
-import json, os, shutil, time
+import json, os, shutil, struct, time
 from copy import deepcopy
 from math import *
 import numpy as np
-from zipfile import ZipFile
+from zipfile import ZipFile, ZIP_STORED
 
 import geopy
 from geopy.distance import geodesic
@@ -314,6 +314,93 @@ def export_kml(modified_features, directory, filename):
     os.system(cmd)
 
 
+def export_npz(route_segments, densified_linestring, polyline, points, offset_points, directory, filename):
+    """writes split segments, handholes and offsets to an uncompressed NumPy .npz
+    archive as columnar arrays; segment i spans coords[seg_offsets[i]:seg_offsets[i + 1]]
+    """
+
+    base_name = polyline['properties']['Name']
+    seg_ids = sorted(route_segments.keys())
+    seg_names = []
+    seg_offsets = [0]
+    coords = []
+    vertex_hh = []
+
+    for k in seg_ids:
+        seg_names.append('{}{}'.format(base_name, k))
+        for v in range(*route_segments[k]):
+            vertex = densified_linestring[v]
+            if not vertex['excess']:
+                coords.append([vertex['lon'], vertex['lat']])
+                vertex_hh.append(vertex['HH'])
+        seg_offsets.append(len(coords))
+
+    hh_coords = [p['geometry']['coordinates'][:2] for p in points]
+    hh_names = [p['properties']['Name'] for p in points]
+    offset_coords = [p['geometry']['coordinates'][:2] for p in offset_points]
+    offset_names = [p['properties']['Name'] for p in offset_points]
+
+    split_npz = os.path.join(directory, '{}Split.npz'.format(filename))
+    np.savez(
+        split_npz,
+        seg_ids=np.array(seg_ids, dtype=np.int32),
+        seg_names=np.array(seg_names, dtype=np.unicode_),
+        seg_offsets=np.array(seg_offsets, dtype=np.int64),
+        coords=np.array(coords, dtype=np.float64).reshape(-1, 2),
+        vertex_hh=np.array(vertex_hh, dtype=np.bool_),
+        hh_coords=np.array(hh_coords, dtype=np.float64).reshape(-1, 2),
+        hh_names=np.array(hh_names, dtype=np.unicode_),
+        offset_coords=np.array(offset_coords, dtype=np.float64).reshape(-1, 2),
+        offset_names=np.array(offset_names, dtype=np.unicode_))
+    return split_npz
+
+
+def memmap_npz_array(split_npz, key):
+    """memory-maps a single array stored in an uncompressed .npz archive without
+    reading the rest of the file
+    """
+
+    with ZipFile(split_npz, 'r') as ref:
+        info = ref.getinfo('{}.npy'.format(key))
+    if info.compress_type != ZIP_STORED:
+        raise ValueError('{} is compressed and cannot be memory-mapped'.format(key))
+
+    f = open(split_npz, 'rb')
+    f.seek(info.header_offset)
+    local_header = f.read(30)
+    name_len, extra_len = struct.unpack('<HH', local_header[26:30])
+    f.seek(info.header_offset + 30 + name_len + extra_len)
+    version = np.lib.format.read_magic(f)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+    offset = f.tell()
+    f.close()
+
+    order = 'F' if fortran_order else 'C'
+    if not shape or 0 in shape:
+        return np.zeros(shape, dtype=dtype, order=order)
+    return np.memmap(split_npz, dtype=dtype, mode='r', offset=offset, shape=shape, order=order)
+
+
+def load_segment(split_npz, segment_id):
+    """returns the (lon, lat) coordinates of a single route segment from an
+    archive written by export_npz
+    """
+
+    index = np.load(split_npz)
+    seg_ids = index['seg_ids']
+    seg_offsets = index['seg_offsets']
+    index.close()
+
+    i = int(np.searchsorted(seg_ids, segment_id))
+    if i == len(seg_ids) or seg_ids[i] != segment_id:
+        raise KeyError(segment_id)
+    coords = memmap_npz_array(split_npz, 'coords')
+    return coords[seg_offsets[i]:seg_offsets[i + 1]]
+
+
 def calculate_offset(points, densified_linestring):
     """https://stackoverflow.com/questions/7222382/get-lat-long-given-current-point-distance-and-bearing"""
 
@@ -376,6 +463,7 @@ if __name__ == '__main__':
     offset_points = calculate_offset(points, densified_linestring)
     insert_offsets(modified_features, points, offset_points)
     export_kml(modified_features, directory, filename)
+    export_npz(route_segments, densified_linestring, polyline, points, offset_points, directory, filename)
 
 
 